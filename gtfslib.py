@@ -6,8 +6,8 @@ from enum import Enum
 import functools
 from pathlib import Path
 import gtfs_kit as gk
+import numpy as np
 import pandas as pd
-from pandas.core.groupby import DataFrameGroupBy
 import folium
 import geopandas as gpd
 
@@ -53,13 +53,94 @@ class CoordsUtil:
         gdf2 = CoordsUtil._to_projected_crs(gdf2)
         return gdf1.distance(gdf2, align=False).iloc[0]
 
+class StopTimeArrays:
+    """
+    Struct-of-arrays view of the merged trips and stop times, keyed by integer
+    stop, trip and route codes (positions in ``stop_ids``, ``trip_ids`` and
+    ``route_ids``).
+
+    Rows are grouped by stop and sorted by departure time, so the stop times of
+    stop code ``s`` are rows ``stop_row_start[s]:stop_row_end[s]``. The ``trip_*``
+    row arrays hold the same stop times grouped by trip and sorted by stop
+    sequence, each trip ending at ``trip_row_end[t]``; ``stop_row_trip_row`` maps
+    each stop-ordered row to its position in that ordering, and ``merged_row``
+    to its position in the merged frame the arrays were built from. Times are
+    nanoseconds since midnight. If either time of a row is missing, both are set to
+    ``MISSING_TIME_NS``, which sorts after every real time and so falls outside any
+    upper bound.
+    """
+
+    MISSING_TIME_NS = np.iinfo(np.int64).max
+
+    def __init__(self, merged: pd.DataFrame, stop_ids: pd.Series, trips: pd.DataFrame, route_ids: pd.Series):
+        self.stop_ids: np.ndarray = stop_ids.to_numpy()
+        self.trip_ids: np.ndarray = trips["trip_id"].to_numpy()
+        self.route_ids: np.ndarray = route_ids.to_numpy()
+        self.stop_codes: dict[str, int] = {stop_id: code for code, stop_id in enumerate(self.stop_ids)}
+        self.trip_codes: dict[str, int] = {trip_id: code for code, trip_id in enumerate(self.trip_ids)}
+
+        # per trip attributes
+        self.trip_headsigns: np.ndarray = trips["trip_headsign"].to_numpy()
+
+        stop_code = self._encode(merged["stop_id"], self.stop_ids)
+        trip_code = self._encode(merged["trip_id"], self.trip_ids)
+        route_code = self._encode(merged["route_id"], self.route_ids)
+        dep_ns = self._to_ns(merged["departure_time"])
+        arr_ns = self._to_ns(merged["arrival_time"])
+        missing_times = (dep_ns == self.MISSING_TIME_NS) | (arr_ns == self.MISSING_TIME_NS)
+        dep_ns[missing_times] = self.MISSING_TIME_NS
+        arr_ns[missing_times] = self.MISSING_TIME_NS
+        seq = merged["stop_sequence"].to_numpy(dtype=np.int32)
+
+        # rows grouped by stop, in departure order
+        order = np.lexsort((dep_ns, stop_code))
+        self.merged_row: np.ndarray = order
+        self.stop_code: np.ndarray = stop_code[order]
+        self.trip_code: np.ndarray = trip_code[order]
+        self.route_code: np.ndarray = route_code[order]
+        self.dep_ns: np.ndarray = dep_ns[order]
+        self.arr_ns: np.ndarray = arr_ns[order]
+        self.stop_row_start, self.stop_row_end = self._row_bounds(self.stop_code, len(self.stop_ids))
+
+        # rows grouped by trip, in stop sequence order
+        trip_order = np.lexsort((seq, trip_code))
+        self.trip_stop_code: np.ndarray = stop_code[trip_order]
+        self.trip_arr_ns: np.ndarray = arr_ns[trip_order]
+        _, self.trip_row_end = self._row_bounds(trip_code[trip_order], len(self.trip_ids))
+        trip_row_of = np.empty_like(trip_order)
+        trip_row_of[trip_order] = np.arange(len(trip_order))
+        self.stop_row_trip_row: np.ndarray = trip_row_of[order]
+
+    @staticmethod
+    def _encode(values: pd.Series, categories: np.ndarray) -> np.ndarray:
+        return pd.Categorical(values, categories=categories).codes.astype(np.int32)
+
+    @classmethod
+    def _to_ns(cls, times: pd.Series) -> np.ndarray:
+        td = times.to_numpy(dtype="timedelta64[ns]")
+        return np.where(np.isnat(td), cls.MISSING_TIME_NS, td.view(np.int64))
+
+    @staticmethod
+    def _row_bounds(sorted_codes: np.ndarray, num_codes: int) -> tuple[np.ndarray, np.ndarray]:
+        codes = np.arange(num_codes)
+        return (
+            np.searchsorted(sorted_codes, codes, side="left"),
+            np.searchsorted(sorted_codes, codes, side="right"),
+        )
+
+    def get_trip_codes(self, trip_ids: pd.Series) -> np.ndarray:
+        return self._encode(trip_ids, self.trip_ids)
+
 class GTFS:
     def __init__(self, gtfs_file: Path):
         self._feed = gk.read_feed(gtfs_file, dist_units="mi")
         self._feed_description = self.feed.describe().set_index("indicator")["value"].to_dict()
         self._geostops = self.feed.get_stops(as_gdf=True, use_utm=True)
-        self._merged_trips_and_stoptimes: DataFrameGroupBy[tuple, True] | None = None
+        self._utm_crs = self._geostops.crs
+        self._stop_xy: np.ndarray = np.column_stack([self._geostops.geometry.x, self._geostops.geometry.y])
+        self._stop_names_by_code: np.ndarray = self._geostops["stop_name"].to_numpy()
         self._trip_activities_by_dates: dict[tuple[str], pd.DataFrame] = dict()
+        self._active_trip_masks_by_date: dict[str, np.ndarray] = dict()
         self._stops_by_id: gpd.GeoDataFrame = self.stops.set_index("stop_id", drop=False)
         self._routes_by_id: pd.DataFrame = self.routes.set_index("route_id", drop=False)
         self._trips_by_id: pd.DataFrame = self.feed.trips.set_index("trip_id", drop=False)
@@ -76,6 +157,31 @@ class GTFS:
     def stops(self) -> gpd.GeoDataFrame:
         return self._geostops
 
+    @property
+    def utm_crs(self):
+        return self._utm_crs
+
+    @functools.cached_property
+    def stoptime_arrays(self) -> StopTimeArrays:
+        return StopTimeArrays(
+            self._merged_trips_and_stoptimes, self.stops["stop_id"], self.feed.trips, self.routes["route_id"]
+        )
+
+    @property
+    def stop_xy(self) -> np.ndarray:
+        """(x, y) of every stop in ``utm_crs``, indexed by stop code"""
+        return self._stop_xy
+
+    @functools.cached_property
+    def stop_latlons(self) -> np.ndarray:
+        """(lat, lon) of every stop in WGS84, indexed by stop code"""
+        wgs_stops = self.stops.to_crs(Projections.WGS84)
+        return np.column_stack([wgs_stops.geometry.y, wgs_stops.geometry.x])
+
+    @property
+    def stop_names_by_code(self) -> np.ndarray:
+        return self._stop_names_by_code
+
     @functools.cached_property
     def route_to_type(self) -> dict[str, RouteType]:
         return {
@@ -101,14 +207,37 @@ class GTFS:
     
     @functools.cached_property
     def stop_names(self) -> dict[str, str]:
-        dct = dict()
-        for _, row in self.stops.iterrows():
-            dct[row["stop_id"]] = row["stop_name"]
-        return dct
+        return dict(zip(self.stops["stop_id"], self.stop_names_by_code))
+
+    @functools.cached_property
+    def _merged_trips_and_stoptimes(self) -> pd.DataFrame:
+        merged = pd.merge(self.feed.trips, self.feed.stop_times)
+        merged["arrival_time"] = pd.to_timedelta(merged["arrival_time"])
+        merged["departure_time"] = pd.to_timedelta(merged["departure_time"])
+        return merged.sort_values(["stop_id", "departure_time"], kind="stable")
+
+    def _get_trip_activity(self, dates: list[str]) -> pd.DataFrame:
+        tuple_dates = tuple(dates)
+        if tuple_dates not in self._trip_activities_by_dates:
+            self._trip_activities_by_dates[tuple_dates] = self.feed.compute_trip_activity(dates)
+        return self._trip_activities_by_dates[tuple_dates]
 
     def get_description_value(self, key: str) -> str:
         return self._feed_description[key]
 
+    def get_active_trip_mask(self, date: str) -> np.ndarray:
+        """
+        Return a boolean array, indexed by trip code (see ``StopTimeArrays``), of the
+        trips active on the given YYYYMMDD date string.
+        """
+        if date not in self._active_trip_masks_by_date:
+            mask = np.zeros(len(self.stoptime_arrays.trip_ids), dtype=bool)
+            if self.feed.subset_dates([date]):
+                a = self._get_trip_activity([date])
+                mask[self.stoptime_arrays.get_trip_codes(a.loc[a[date] == 1, "trip_id"])] = True
+            self._active_trip_masks_by_date[date] = mask
+        return self._active_trip_masks_by_date[date]
+
     def get_stop(self, stop_id: str | int) -> gpd.GeoDataFrame:
         df = self._stops_by_id.loc[[str(stop_id)]].copy()
         df.index.set_names('', inplace=True)
@@ -130,8 +259,8 @@ class GTFS:
         Adapted from the gtfs_kit.Feed.get_stops_in_area method to reduce amount of
         CRS changes performed.
         """
-        if self.stops.crs != area.crs:
-            area = area.to_crs(self.stops.crs)
+        if self.utm_crs != area.crs:
+            area = area.to_crs(self.utm_crs)
         return self.stops.merge(
             gpd.sjoin(self.stops, area)
             .filter(["stop_id"])
@@ -144,7 +273,7 @@ class GTFS:
 
         Return a DataFrame whose columns are all those in ``feed.trips`` plus those in
         ``feed.stop_times`` plus ``'date'``, and the stop IDs are restricted to the given
-        stop ID.
+        stop ID. ``arrival_time`` and ``departure_time`` are timedeltas.
         The result is sorted by date then departure time.
         
         Adapted from the gtfs_kit.Feed.build_stop_timetable method to use caching of key
@@ -154,23 +283,16 @@ class GTFS:
         if not dates:
             return pd.DataFrame()
 
-        if self._merged_trips_and_stoptimes is None:
-            merged = pd.merge(
-                self.feed.trips, self.feed.stop_times
-            )
-            self._merged_trips_and_stoptimes = merged.groupby(["stop_id"], sort=False)
-        t = self._merged_trips_and_stoptimes.get_group((stop_id,))
-
-        tuple_dates = tuple(dates)
-        if tuple_dates not in self._trip_activities_by_dates:
-            self._trip_activities_by_dates[tuple_dates] = self.feed.compute_trip_activity(dates)
-        a = self._trip_activities_by_dates[tuple_dates]
+        arrays = self.stoptime_arrays
+        stop_code = arrays.stop_codes[stop_id]
+        rows = slice(arrays.stop_row_start[stop_code], arrays.stop_row_end[stop_code])
+        t = self._merged_trips_and_stoptimes.iloc[arrays.merged_row[rows]]
+        trip_codes = arrays.trip_code[rows]
 
         frames = []
         for date in dates:
             # Slice to stops active on date
-            ids = a.loc[a[date] == 1, "trip_id"]
-            f = t[t["trip_id"].isin(ids)].copy()
+            f = t[self.get_active_trip_mask(date)[trip_codes]].copy()
             f["date"] = date
             frames.append(f)
 
@@ -1,14 +1,13 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-import functools
-import heapq
 import itertools
+from typing import NamedTuple
 
+import geopandas as gpd
+import numpy as np
 import pandas as pd
-import shapely
 from tqdm import tqdm
-from gtfslib import GTFS, CoordsUtil, Projections, RouteType
+from gtfslib import GTFS, Projections, RouteType
 from pathlib import Path
 import folium
 from datetime import datetime, timedelta, date, time
@@ -17,6 +16,13 @@ import time as pytime
 import requests
 import shutil
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it explore() runs as plain python
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 START_TIME = datetime(2024, 12, 16, 9, 0, 0)
 HIDE_DURATION = timedelta(minutes=90)
 START_STOP = 22750 # Akard
@@ -69,7 +75,6 @@ print(f"Finished initialization in {_init_time_stop-_init_time:.2f}s.")
 
 StopId = str | int
 TripId = str | int
-StopSeq = int
 Timeish = time | timedelta
 
 def timedelta_coerce(t: Timeish):
@@ -77,89 +82,97 @@ def timedelta_coerce(t: Timeish):
         return t
     return datetime.combine(date.min, t) - datetime.combine(date.min, time())
 
-def timeish_hms_colon_str(t: Timeish):
-    td_sec = timedelta_coerce(t).seconds
+def ns_hms_colon_str(ns: int):
+    td_sec = ns // 1_000_000_000 % 86400
     h,m,s = td_sec // 3600, (td_sec % 3600) // 60, td_sec % 60
     return f'{h:02d}:{m:02d}:{s:02d}'
 
-def timeish_minsec_str(t: Timeish):
-    td_sec = timedelta_coerce(t).seconds
+def ns_minsec_str(ns: int):
+    td_sec = ns // 1_000_000_000 % 86400
     m,s = td_sec // 60, td_sec % 60
     return f'{m}m{s:02d}s'
 
 def dt_minus_date(dt: datetime, d: date):
     return dt - datetime.combine(d, time())
 
-@functools.lru_cache()
-def get_stop_timetable(stop: StopId):
-    tt = gtfs.build_stop_timetable(str(stop), [today])
-    tt["arrival_time"] = pd.to_timedelta(tt["arrival_time"])
-    tt["departure_time"] = pd.to_timedelta(tt["departure_time"])
-    return tt
-
-
-def df_time_bound(df: pd.DataFrame, lower: Timeish | None = None, upper: Timeish | None = None):
-    mask = pd.notna(df["departure_time"]) & pd.notna(df["arrival_time"])
-    if lower:
-        mask &= df["departure_time"] >= timedelta_coerce(lower)
-    if upper:
-        mask &= df["arrival_time"] <= timedelta_coerce(upper)
-    return df[mask]
+def timedelta_ns(td: timedelta) -> int:
+    return td // timedelta(microseconds=1) * 1000
 
-def trips_between_for_stop(stop: StopId, t1: Timeish, t2: Timeish):
-    tt = get_stop_timetable(stop)
-    return df_time_bound(tt, t1, t2)
+def ns_timedelta(ns: int) -> timedelta:
+    return timedelta(microseconds=ns // 1000)
 
 
-stop_times: pd.DataFrame = gtfs.feed.stop_times
-stop_times["arrival_time"] = pd.to_timedelta(stop_times["arrival_time"])
-stop_times["departure_time"] = pd.to_timedelta(stop_times["departure_time"])
-stop_times_by_trip = stop_times.groupby(["trip_id"], sort=False)
+st_arrays = gtfs.stoptime_arrays
+# the search only ever runs on a single day, so resolve which trips run today once, by trip code
+active_trip_mask = gtfs.get_active_trip_mask(today)
 
-def get_future_stops_on_trip(trip: TripId, stop_seq: StopSeq = 0):
-    st = stop_times_by_trip.get_group((str(trip),))
-    return st[st["stop_sequence"] > int(stop_seq)]
+# travel and hiding modes are fixed for the run, so resolve them per trip / stop code up front
+trip_allowed_mask = np.zeros(len(st_arrays.trip_ids), dtype=bool)
+trip_allowed_mask[[
+    code for trip_id, code in st_arrays.trip_codes.items()
+    if gtfs.trip_route_types[trip_id] in ALLOWED_TRAVEL_MODES
+]] = True
+stop_hiding_mask = np.zeros(len(st_arrays.stop_ids), dtype=bool)
+stop_hiding_mask[[
+    code for stop_id, code in st_arrays.stop_codes.items()
+    if any(rtype in ALLOWED_HIDING_MODES for rtype in gtfs.stop_route_types[stop_id])
+]] = True
 
 
 class RouteSegmentCollection:
-    @dataclass
-    class RouteSegment:
-        departure_td: timedelta
-        arrival_td: timedelta
+    class RouteSegment(NamedTuple):
+        departure_ns: int # nanoseconds since midnight of the collection's day
+        arrival_ns: int
         route_name: str
         arrival_stop_id: StopId
 
     # TODO use special route segment flags rather than checking route names
     STARTING_ROUTE_NAME = "__start__"
 
-    def __init__(self, day: date, *trips: RouteSegment):
+    # collections form a persistent linked list: each node holds its last segment and
+    # points at the collection it was appended to, so appending never copies the path
+    def __init__(self, day: date, segment: RouteSegment | None = None, parent: RouteSegmentCollection | None = None):
         self.day = day
-        self.trips = trips
+        self.segment = segment
+        self.parent = parent
+        self._len = 0 if segment is None else (len(parent) if parent is not None else 0) + 1
+        self._hash = hash((id(parent), segment))
 
-    def append(self, departure_td: timedelta, arrival_td: timedelta, route_name: str, arrival_stop_id: StopId) -> RouteSegmentCollection:
-        return self.append_(RouteSegmentCollection.RouteSegment(departure_td, arrival_td, route_name, arrival_stop_id))
+    def append(self, departure_ns: int, arrival_ns: int, route_name: str, arrival_stop_id: StopId) -> RouteSegmentCollection:
+        return self.append_(RouteSegmentCollection.RouteSegment(departure_ns, arrival_ns, route_name, arrival_stop_id))
 
     def append_(self, trip: RouteSegment) -> RouteSegmentCollection:
-        return RouteSegmentCollection(self.day, *self.trips, trip)
+        return RouteSegmentCollection(self.day, trip, self)
 
     def get_last_trip(self) -> RouteSegment | None:
-        if not len(self.trips):
-            return None
-        return self.trips[-1]
+        return self.segment
+
+    def _iter_segments(self):
+        # walks parent pointers, so segments are yielded from last to first
+        node = self
+        while node is not None and node.segment is not None:
+            yield node.segment
+            node = node.parent
+
+    def get_trips(self) -> list[RouteSegment]:
+        trips = list(self._iter_segments())
+        trips.reverse()
+        return trips
 
     def get_arrival_dt(self) -> datetime | None:
         if (last_trip := self.get_last_trip()) is None:
             return None
-        return datetime.combine(self.day, time()) + last_trip.arrival_td
+        return datetime.combine(self.day, time()) + ns_timedelta(last_trip.arrival_ns)
 
     def populate_waiting(self) -> RouteSegmentCollection:
-        segments = [self.trips[0]]
-        for a, b in itertools.pairwise(self.trips):
-            if a.arrival_td != b.departure_td:
+        trips = self.get_trips()
+        collection = RouteSegmentCollection(self.day).append_(trips[0])
+        for a, b in itertools.pairwise(trips):
+            if a.arrival_ns != b.departure_ns:
                 wait_route_name = f'Wait at stop'
-                segments.append(RouteSegmentCollection.RouteSegment(a.arrival_td, b.departure_td, wait_route_name, a.arrival_stop_id))
-            segments.append(b)
-        return RouteSegmentCollection(self.day, *segments)
+                collection = collection.append(a.arrival_ns, b.departure_ns, wait_route_name, a.arrival_stop_id)
+            collection = collection.append_(b)
+        return collection
 
     def to_str(self, sep: str = "\n") -> list[str]:
         route_text = [
@@ -168,158 +181,322 @@ class RouteSegmentCollection:
             "",
             "Steps:",
         ]
-        for segment in self.trips:
+        for segment in self.get_trips():
             arrival_stop_name = gtfs.stop_names[str(segment.arrival_stop_id)]
             if segment.route_name == self.__class__.STARTING_ROUTE_NAME:
-                route_text.append(f"{timeish_hms_colon_str(segment.departure_td)} Start at {arrival_stop_name}")
+                route_text.append(f"{ns_hms_colon_str(segment.departure_ns)} Start at {arrival_stop_name}")
             else:
                 route_str = segment.route_name
                 if not (route_str.startswith("Walk ") or route_str.startswith("Wait ")):
                     route_str = "Take " + route_str
-                route_text.append(f" - ({timeish_minsec_str(segment.arrival_td - segment.departure_td)}) {route_str}")
-                route_text.append(f"{timeish_hms_colon_str(segment.arrival_td)} {arrival_stop_name}")
+                route_text.append(f" - ({ns_minsec_str(segment.arrival_ns - segment.departure_ns)}) {route_str}")
+                route_text.append(f"{ns_hms_colon_str(segment.arrival_ns)} {arrival_stop_name}")
         return sep.join(route_text)
 
     @classmethod
     def starting_collection(cls, start_dt: datetime, start_stop_id: StopId):
-        td = timedelta_coerce(start_dt.time())
-        return cls(start_dt.date()).append(td, td, cls.STARTING_ROUTE_NAME, start_stop_id)
+        start_ns = timedelta_ns(timedelta_coerce(start_dt.time()))
+        return cls(start_dt.date()).append(start_ns, start_ns, cls.STARTING_ROUTE_NAME, start_stop_id)
 
     def __str__(self):
-        return str(self.trips)
+        return str(tuple(self.get_trips()))
 
     def __iter__(self):
-        return iter(self.trips)
+        return iter(self.get_trips())
 
     def __len__(self):
-        return len(self.trips)
-
-    def __get_cmp_key(self):
-        if not len(self.trips):
-            raise ValueError("route collection needs a segment to compare against")
-        return (self.get_last_trip().arrival_td, len(self.trips))
-
-    def __lt__(self, other):
-        if not isinstance(other, RouteSegmentCollection):
-            raise TypeError
-        return self.__get_cmp_key() < other.__get_cmp_key()
-
-    def __gt__(self, other):
-        if not isinstance(other, RouteSegmentCollection):
-            raise TypeError
-        return self.__get_cmp_key() > other.__get_cmp_key()
+        return self._len
 
     def __hash__(self):
-        return hash(self.trips)
+        return self._hash
 
     def __eq__(self, other):
-        return isinstance(other, RouteSegmentCollection) and self.trips == other.trips
-
-
-visited_stops: dict[str, RouteSegmentCollection] = dict() # stop_id : fastest route combo
-visited_trips: set[str] = set()
-
-added_stops: dict[str, timedelta] = dict() # temp dict to stop adding to queue
-
-end_timedelta = dt_minus_date(end_time, START_TIME.date())
-
-
-queue = [RouteSegmentCollection.starting_collection(START_TIME, str(START_STOP))]
-heapq.heapify(queue)
-
-def push_to_queue(route_collection: RouteSegmentCollection):
-    stop_id, arrival_time = route_collection.get_last_trip().arrival_stop_id, route_collection.get_last_trip().arrival_td
-    if stop_id in added_stops:
-        if arrival_time > added_stops[stop_id]:
-            # if stop has already been added and the tentative time is later than the already queued time, skip
-            return
-    heapq.heappush(queue, route_collection)
-    added_stops[stop_id] = arrival_time
-
-t = tqdm()
-while len(queue):
-    t.set_description(str(len(queue)), refresh=False)
-    t.update()
-    route_collection = heapq.heappop(queue)
-    td, stop_id = route_collection.get_last_trip().arrival_td, route_collection.get_last_trip().arrival_stop_id
-    if stop_id in visited_stops:
-        continue
-    if td > end_timedelta:
-        continue
-    visited_stops[stop_id] = route_collection
-    stop_timetable = trips_between_for_stop(stop_id, td, end_timedelta)
-    first_available_routes = stop_timetable.drop_duplicates('route_id', keep='first')
-    # print(stop_timetable)
-    for _, row_gdf in first_available_routes.iterrows():
-        trip_id, stop_seq, trip_name = row_gdf["trip_id"], row_gdf["stop_sequence"], row_gdf["trip_headsign"]
-        departure_time = timedelta_coerce(row_gdf["departure_time"])
-
-        # only travel in allowed route types
-        if gtfs.trip_route_types[trip_id] not in ALLOWED_TRAVEL_MODES:
+        return (
+            isinstance(other, RouteSegmentCollection)
+            and self.parent is other.parent
+            and self.segment == other.segment
+        )
+
+
+# kinds of edge recorded by explore(), besides trip codes (>= 0) for riding a trip
+START_EDGE = -1
+WALK_EDGE = -2
+
+# columns of the edge table built by explore()
+EDGE_PARENT = 0
+EDGE_KIND = 1
+EDGE_DEPARTURE = 2
+EDGE_ARRIVAL = 3
+EDGE_STOP = 4
+
+UNQUEUED_NS = np.iinfo(np.int64).max
+
+@njit(cache=True)
+def _heap_less(edges: np.ndarray, a: int, b: int) -> bool:
+    # order by arrival, then by edge index, which doubles as an insertion counter
+    return edges[a, EDGE_ARRIVAL] < edges[b, EDGE_ARRIVAL] or (edges[a, EDGE_ARRIVAL] == edges[b, EDGE_ARRIVAL] and a < b)
+
+@njit(cache=True)
+def _heap_push(heap: np.ndarray, heap_size: int, edges: np.ndarray, edge: int) -> int:
+    i = heap_size
+    heap[i] = edge
+    while i > 0:
+        parent = (i - 1) // 2
+        if not _heap_less(edges, heap[i], heap[parent]):
+            break
+        heap[i], heap[parent] = heap[parent], heap[i]
+        i = parent
+    return heap_size + 1
+
+@njit(cache=True)
+def _heap_pop(heap: np.ndarray, heap_size: int, edges: np.ndarray) -> tuple[int, int]:
+    top = heap[0]
+    heap_size -= 1
+    heap[0] = heap[heap_size]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= heap_size:
+            break
+        if child + 1 < heap_size and _heap_less(edges, heap[child + 1], heap[child]):
+            child += 1
+        if not _heap_less(edges, heap[child], heap[i]):
+            break
+        heap[i], heap[child] = heap[child], heap[i]
+        i = child
+    return top, heap_size
+
+@njit(cache=True)
+def _push_edge(
+    edges: np.ndarray,
+    walked: np.ndarray,
+    heap: np.ndarray,
+    num_edges: int,
+    heap_size: int,
+    queued_ns: np.ndarray,
+    parent: int,
+    kind: int,
+    departure: int,
+    arrival: int,
+    distance: float,
+    stop: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, int, int]:
+    if arrival > queued_ns[stop]:
+        # if stop has already been queued with an earlier time, skip
+        return edges, walked, heap, num_edges, heap_size
+    queued_ns[stop] = arrival
+    if num_edges == len(edges):
+        # every edge is pushed at most once, so the heap never outgrows the edge table
+        edges = np.concatenate((edges, np.empty_like(edges)))
+        walked = np.concatenate((walked, np.empty_like(walked)))
+        heap = np.concatenate((heap, np.empty_like(heap)))
+    edges[num_edges, EDGE_PARENT] = parent
+    edges[num_edges, EDGE_KIND] = kind
+    edges[num_edges, EDGE_DEPARTURE] = departure
+    edges[num_edges, EDGE_ARRIVAL] = arrival
+    edges[num_edges, EDGE_STOP] = stop
+    walked[num_edges] = distance
+    heap_size = _heap_push(heap, heap_size, edges, num_edges)
+    return edges, walked, heap, num_edges + 1, heap_size
+
+@njit(cache=True)
+def explore(
+    start_stop_code: int,
+    start_ns: int,
+    end_ns: int,
+    stop_row_start: np.ndarray,
+    stop_row_end: np.ndarray,
+    dep_ns: np.ndarray,
+    arr_ns: np.ndarray,
+    trip_code: np.ndarray,
+    route_code: np.ndarray,
+    stop_row_trip_row: np.ndarray,
+    trip_row_end: np.ndarray,
+    trip_arr_ns: np.ndarray,
+    trip_stop_code: np.ndarray,
+    trip_mask: np.ndarray,
+    num_routes: int,
+    stop_xy: np.ndarray,
+    walking_speed: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int, int]:
+    """
+    Earliest-arrival search from the start stop over the StopTimeArrays, riding only
+    trips in trip_mask and arriving no later than end_ns.
+
+    Works purely on ints and preallocated numpy arrays so that it compiles with numba.
+    Every relaxed edge is a row of the edges table (see the EDGE_* columns), where the
+    kind is a trip code or START_EDGE / WALK_EDGE, with the meters walked in walked.
+    Returns the stop codes in the order they were reached, the index of the edge each
+    stop was reached by (-1 if unreachable), the edges, the meters walked per edge,
+    the number of trips ridden and the number of queue pops.
+    """
+    num_stops = len(stop_row_start)
+    parent_edge = np.full(num_stops, -1, dtype=np.int64)
+    queued_ns = np.full(num_stops, UNQUEUED_NS, dtype=np.int64) # earliest arrival queued so far per stop
+    visited_trips = np.zeros(len(trip_row_end), dtype=np.bool_)
+    route_seen_at = np.full(num_routes, -1, dtype=np.int64) # stop code that last boarded each route
+    settled_stops = np.empty(num_stops, dtype=np.int64)
+    num_settled = 0
+
+    capacity = max(16, num_stops)
+    edges = np.empty((capacity, 5), dtype=np.int64)
+    walked = np.empty(capacity, dtype=np.float64)
+    heap = np.empty(capacity, dtype=np.int64) # min-heap of edge indices
+    num_edges = 0
+    heap_size = 0
+    num_pops = 0
+
+    edges, walked, heap, num_edges, heap_size = _push_edge(
+        edges, walked, heap, num_edges, heap_size, queued_ns,
+        start_stop_code, START_EDGE, start_ns, start_ns, 0.0, start_stop_code,
+    )
+    while heap_size > 0:
+        edge, heap_size = _heap_pop(heap, heap_size, edges)
+        num_pops += 1
+        stop = edges[edge, EDGE_STOP]
+        td_ns = edges[edge, EDGE_ARRIVAL]
+        if parent_edge[stop] >= 0:
             continue
+        if td_ns > end_ns:
+            continue
+        parent_edge[stop] = edge
+        settled_stops[num_settled] = stop
+        num_settled += 1
+
+        # rows of a stop are sorted by departure, so the lower bound is a binary search
+        lo, hi = stop_row_start[stop], stop_row_end[stop]
+        lo += np.searchsorted(dep_ns[lo:hi], td_ns)
+        rows = lo + np.nonzero((arr_ns[lo:hi] <= end_ns) & trip_mask[trip_code[lo:hi]])[0]
+        # rows are in departure order, so the first row seen for each route is its first available trip
+        for row in rows:
+            route = route_code[row]
+            if route_seen_at[route] == stop:
+                continue
+            route_seen_at[route] = stop
 
-        if trip_id in visited_trips:
+            trip = trip_code[row]
+            if visited_trips[trip]:
+                continue
+            visited_trips[trip] = True
+
+            # trip rows are in stop sequence order, so the future stops are the tail after the row itself
+            for trip_row in range(stop_row_trip_row[row] + 1, trip_row_end[trip]):
+                if trip_arr_ns[trip_row] > end_ns:
+                    continue
+                edges, walked, heap, num_edges, heap_size = _push_edge(
+                    edges, walked, heap, num_edges, heap_size, queued_ns,
+                    stop, trip, dep_ns[row], trip_arr_ns[trip_row], 0.0, trip_stop_code[trip_row],
+                )
+
+        # if we had just walked, walking again is not going to provide new stations
+        if edges[edge, EDGE_KIND] == WALK_EDGE:
             continue
-        visited_trips.add(trip_id)
 
-        for _, future_stop in get_future_stops_on_trip(trip_id, stop_seq).iterrows():
-            arrival_time = timedelta_coerce(future_stop["arrival_time"])
-            if arrival_time > end_timedelta:
+        # walking calculation
+        if walking_speed <= 0:
+            continue
+        walking_distance = walking_speed * ((end_ns - td_ns) // 1_000_000_000)
+        dists = np.hypot(stop_xy[:, 0] - stop_xy[stop, 0], stop_xy[:, 1] - stop_xy[stop, 1])
+        walk_arrival_ns = td_ns + np.rint(dists * 1_000_000_000 / walking_speed).astype(np.int64)
+        for future_stop in np.nonzero((dists <= walking_distance) & (walk_arrival_ns <= end_ns))[0]:
+            if future_stop == stop:
                 continue
-            future_stop_id = future_stop["stop_id"]
-            push_to_queue(route_collection.append(departure_time, arrival_time, trip_name, future_stop_id))
-
-    # if we had just walked, walking again is not going to provide new stations
-    if route_collection.get_last_trip().route_name.startswith("Walk "):
-        continue
-
-    # walking calculation
-    if WALKING_SPEED <= 0:
-        continue
-    remaining_time = end_timedelta - td
-    walking_distance = WALKING_SPEED * remaining_time.seconds
-    stop_df = gtfs.get_stop(stop_id)
-    buffered_area = CoordsUtil.buffer_points(walking_distance, stop_df)
-    stop_geometry = stop_df.iloc[0]["geometry"]
-    stops_in_area = gtfs.get_stops_in_area(buffered_area)
-    for _, row in stops_in_area.iterrows():
-        distance_to_stop = shapely.distance(stop_geometry, row["geometry"])
-        arrival_time = td + (distance_to_stop / WALKING_SPEED * timedelta(seconds=1))
-        future_stop_id = row["stop_id"]
-        push_to_queue(route_collection.append(td, arrival_time, f"Walk {round(distance_to_stop)} meters", future_stop_id))
+            edges, walked, heap, num_edges, heap_size = _push_edge(
+                edges, walked, heap, num_edges, heap_size, queued_ns,
+                stop, WALK_EDGE, td_ns, walk_arrival_ns[future_stop], dists[future_stop], future_stop,
+            )
+
+    return (
+        settled_stops[:num_settled],
+        parent_edge,
+        edges[:num_edges],
+        walked[:num_edges],
+        np.count_nonzero(visited_trips),
+        num_pops,
+    )
+
 
+end_ns = timedelta_ns(dt_minus_date(end_time, START_TIME.date()))
+
+# explore() runs without callbacks, so the progress bar counts its queue pops once it returns
+t = tqdm()
+settled_stops, parent_edge, edges, walked_meters, num_visited_trips, num_pops = explore(
+    st_arrays.stop_codes[str(START_STOP)],
+    timedelta_ns(timedelta_coerce(START_TIME.time())),
+    end_ns,
+    st_arrays.stop_row_start,
+    st_arrays.stop_row_end,
+    st_arrays.dep_ns,
+    st_arrays.arr_ns,
+    st_arrays.trip_code,
+    st_arrays.route_code,
+    st_arrays.stop_row_trip_row,
+    st_arrays.trip_row_end,
+    st_arrays.trip_arr_ns,
+    st_arrays.trip_stop_code,
+    active_trip_mask & trip_allowed_mask,
+    len(st_arrays.route_ids),
+    gtfs.stop_xy,
+    WALKING_SPEED,
+)
+t.update(num_pops)
 t.close()
 
-print(f'Evaluated {len(visited_trips)} trips and found {len(visited_stops)} reachable stops.')
+# rebuild routes only for the reached stops; a stop's parent is always reached before it,
+# so each route extends the already built route of its parent
+visited_stops: dict[str, RouteSegmentCollection] = dict() # stop_id : fastest route combo
+route_collections: dict[int, RouteSegmentCollection] = dict() # stop code : fastest route combo
+edge_rows = edges.tolist()
+for stop_code in settled_stops.tolist():
+    edge = parent_edge[stop_code]
+    parent, kind, departure_ns, arrival_ns, _ = edge_rows[edge]
+    stop_id = st_arrays.stop_ids[stop_code]
+    if kind == START_EDGE:
+        route_collection = RouteSegmentCollection.starting_collection(START_TIME, stop_id)
+    else:
+        if kind == WALK_EDGE:
+            route_name = f"Walk {round(walked_meters[edge])} meters"
+        else:
+            route_name = st_arrays.trip_headsigns[kind]
+        route_collection = route_collections[parent].append(departure_ns, arrival_ns, route_name, stop_id)
+    route_collections[stop_code] = route_collection
+    visited_stops[stop_id] = route_collection
+
+print(f'Evaluated {num_visited_trips} trips and found {len(visited_stops)} reachable stops.')
 
 # import pprint
 # pprint.pprint(visited_stops)
 
 m = folium.Map(location=[32.7769, -96.7972], zoom_start=10)
 
-for stop_id, route_collection in visited_stops.items():
-    stop = gtfs.get_stop(stop_id).to_crs(Projections.WGS84).iloc[0]
-    name, point = stop["stop_name"], stop.geometry
-    lon, lat = point.x, point.y
-    is_valid_hiding_spot = any(
-        rtype in ALLOWED_HIDING_MODES
-        for rtype in gtfs.stop_route_types[stop_id]
-    )
-
-    popup = folium.Popup(
-        route_collection.populate_waiting().to_str(sep='<br>'),
-        max_width=300
-    )
-
-    folium.Circle(
-        location=[lat, lon],
-        tooltip=name,
-        popup=popup,
-        fill_color="#00f" if is_valid_hiding_spot else "#f00",
-        fill_opacity=0.2,
-        color="black",
-        weight=1,
-        radius=804.672 if is_valid_hiding_spot else 20,
-    ).add_to(m)
+# render every reachable stop as one GeoJson layer rather than one folium.Circle per stop
+reached_codes = [st_arrays.stop_codes[stop_id] for stop_id in visited_stops]
+reached_latlons = gtfs.stop_latlons[reached_codes]
+reached_stops = gpd.GeoDataFrame(
+    {
+        "name": gtfs.stop_names_by_code[reached_codes].tolist(),
+        "route": [
+            route_collection.populate_waiting().to_str(sep='<br>')
+            for route_collection in visited_stops.values()
+        ],
+        "hiding": stop_hiding_mask[reached_codes].tolist(),
+    },
+    geometry=gpd.points_from_xy(reached_latlons[:, 1], reached_latlons[:, 0]),
+    crs=Projections.WGS84,
+)
+
+folium.GeoJson(
+    reached_stops,
+    marker=folium.Circle(fill=True),
+    style_function=lambda feature: {
+        "fillColor": "#00f" if feature["properties"]["hiding"] else "#f00",
+        "fillOpacity": 0.2,
+        "color": "black",
+        "weight": 1,
+        "radius": 804.672 if feature["properties"]["hiding"] else 20,
+    },
+    tooltip=folium.GeoJsonTooltip(["name"], labels=False),
+    popup=folium.GeoJsonPopup(["route"], labels=False, max_width=300),
+).add_to(m)
 
 m.save("jetlag.html")